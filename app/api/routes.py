@@ -1,24 +1,65 @@
 import os
-from typing import Optional
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from langchain_core.messages import HumanMessage
+import shutil
+import time
+import uuid
+from typing import Dict, Optional
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from langchain_core.messages import AIMessageChunk, HumanMessage
 
 from app.services.db import ingest_file
-from app.services.graph import app_graph
 
 router = APIRouter()
 
 
-@router.post("/upload")
+# Ingestion status per upload_id: "processing", "completed" or "failed".
+# Finished statuses are dropped STATUS_TTL seconds after ingestion ends.
+STATUS_TTL = 3600
+ingestion_status: Dict[str, dict] = {}
+
+
+def finish_ingestion(upload_id: str, status: dict):
+    """Records the final status of an upload and drops the expired ones."""
+    now = time.time()
+    expired = [key for key, value in ingestion_status.items() if "expires_at" in value and value["expires_at"] <= now]
+    for expired_id in expired:
+        del ingestion_status[expired_id]
+
+    ingestion_status[upload_id] = {**status, "expires_at": now + STATUS_TTL}
+
+
+async def run_ingestion(file_path: str, session_id: str, upload_id: str):
+    """
+    Background task: ingests the saved file, records the status
+    and always cleans up the temporary file.
+    """
+    try:
+        # Run the ingestion logic (The Pink Node in the architecture)
+        # This splits the PDF and saves it to the vector store
+        await ingest_file(file_path, session_id)
+        finish_ingestion(upload_id, {"session_id": session_id, "status": "completed"})
+
+    except Exception as e:
+        print(f"Error during ingestion: {e}")
+        finish_ingestion(upload_id, {"session_id": session_id, "status": "failed", "detail": str(e)})
+
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+@router.post("/upload", status_code=202)
 async def upload_document(
+        background_tasks: BackgroundTasks,
         file: UploadFile = File(...),
         session_id: str = Form(...)
 ):
     """
     Endpoint to upload a PDF file.
-    1. Saves the file temporarily.
-    2. Ingests it into ChromaDB tagged with the session_id.
-    3. Cleans up the temporary file.
+    1. Streams the file to a temporary location.
+    2. Schedules ingestion into the vector store (tagged with the session_id) as a background task.
+    3. Returns immediately with an upload_id; progress is available at /status/{upload_id}.
     """
     temp_dir = "temp_uploads"
     file_path: Optional[str] = None
@@ -27,26 +68,25 @@ async def upload_document(
         # Create temp directory if it doesn't exist
         os.makedirs(temp_dir, exist_ok=True)
 
-        # Define temporary file path
-        file_path = os.path.join(temp_dir, file.filename)
+        # Define a unique temporary file path (ingestion runs after the response is sent)
+        upload_id = uuid.uuid4().hex
+        file_path = os.path.join(temp_dir, f"{upload_id}_{os.path.basename(file.filename)}")
 
-        # Write the uploaded file to disk
-        # We use 'wb' (write binary) which is standard for saving uploads
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Stream the uploaded file to disk in 1MB blocks
+        def save_upload():
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer, length=1024 * 1024)
 
-        # Run the ingestion logic (The Pink Node in the architecture)
-        # This splits the PDF and saves it to ChromaDB
-        ingest_file(file_path, session_id)
+        await run_in_threadpool(save_upload)
 
-        # Clean up: remove the file after successful indexing
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
+        # Ingest after the response is sent, the background task cleans up the file
+        ingestion_status[upload_id] = {"session_id": session_id, "status": "processing"}
+        background_tasks.add_task(run_ingestion, file_path, session_id, upload_id)
 
         return {
-            "status": "success",
-            "message": "File processed and indexed successfully.",
+            "status": "accepted",
+            "message": "File received, indexing in progress.",
+            "upload_id": upload_id,
             "session_id": session_id
         }
 
@@ -60,8 +100,19 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 
+@router.get("/status/{upload_id}")
+async def ingestion_status_endpoint(upload_id: str):
+    """Returns the ingestion status of an upload (finished ones expire after STATUS_TTL seconds)."""
+    status = ingestion_status.get(upload_id)
+    if status is None or ("expires_at" in status and status["expires_at"] <= time.time()):
+        raise HTTPException(status_code=404, detail="Upload not found.")
+
+    return {"upload_id": upload_id, **{key: value for key, value in status.items() if key != "expires_at"}}
+
+
 @router.post("/chat")
 async def chat_endpoint(
+        request: Request,
         question: str = Form(...),
         session_id: str = Form(...)
 ):
@@ -85,7 +136,7 @@ async def chat_endpoint(
 
         # 3. Invoke the graph with the config
         # Without 'config', MemorySaver creates a new thread every time.
-        result = app_graph.invoke(initial_state, config=config)
+        result = await request.app.state.graph.ainvoke(initial_state, config=config)
 
         return {
             "answer": result.get("generation"),
@@ -95,4 +146,69 @@ async def chat_endpoint(
 
     except Exception as e:
         print(f"Error during chat: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(
+        request: Request,
+        question: str = Form(...),
+        session_id: str = Form(...)
+):
+    """
+    Streaming chat endpoint.
+    Runs the same LangGraph workflow as /chat, but streams the tokens of the
+    Generate node to the client as plain text while they are produced.
+    The hallucination check is skipped on this path, since an answer that was
+    already streamed cannot be taken back.
+    """
+    config = {"configurable": {"thread_id": session_id, "skip_hallucination_check": True}}
+    initial_state = {
+        "question": question,
+        "session_id": session_id,
+        "messages": [HumanMessage(content=question)]
+    }
+
+    async def token_stream():
+        streamed = False
+
+        async for mode, payload in request.app.state.graph.astream(
+                initial_state,
+                config=config,
+                stream_mode=["messages", "updates"]
+        ):
+            if mode == "messages":
+                chunk, metadata = payload
+                # Only forward token chunks: the node also emits the full AIMessage it writes to state
+                if not isinstance(chunk, AIMessageChunk) or metadata.get("langgraph_node") != "generate":
+                    continue
+                if chunk.content:
+                    streamed = True
+                    yield chunk.content
+
+            elif "generate" in payload and not streamed:
+                # Nothing was streamed (e.g. semantic cache hit) -> send the whole generation
+                yield payload["generate"]["generation"]
+
+    stream = token_stream()
+
+    # Run until the first token, so routing / retrieval errors still return a regular 500
+    try:
+        first_chunk = await anext(stream)
+    except StopAsyncIteration:
+        first_chunk = ""
+    except Exception as e:
+        print(f"Error during chat stream: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+    async def response_stream():
+        yield first_chunk
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent, so mark the failure in the body
+            print(f"Error during chat stream: {e}")
+            yield f"\n\n[ERROR] Error processing request: {str(e)}"
+
+    return StreamingResponse(response_stream(), media_type="text/plain")
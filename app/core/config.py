@@ -11,6 +11,12 @@ class Settings(BaseSettings):
     LANGCHAIN_TRACING_V2: str = "false"
     LANGCHAIN_API_KEY: str = ""
 
+    # SQLite file for the LangGraph checkpointer (chat history). Use ":memory:" to keep it ephemeral.
+    CHECKPOINT_DB_PATH: str = "checkpoints.db"
+
+    # Directory where the document vector index is saved. Leave empty to keep it in memory.
+    VECTOR_STORE_DIR: str = "vector_store"
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -1,5 +1,7 @@
-from typing import Literal, List
+from functools import cache
+from typing import Literal, List, Optional
 
+import httpx
 from langchain_groq import ChatGroq
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -7,18 +9,64 @@ from langchain_core.output_parsers import StrOutputParser
 from app.core.config import settings
 
 # --- LLM Setup ---
-# Use a cheaper model for routing, multi-query and grading to save costs.
+# Clients and chains are built lazily on first use (and then reused), so importing
+# this module, e.g. for ingestion only, does not construct any LLM client.
+
+@cache
+def _shared_async_client() -> httpx.AsyncClient:
+    """Shared keep-alive connection pool for async Groq calls (avoids a TLS handshake per request)."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+
+
+async def aclose_clients():
+    """Closes the shared HTTP client (on shutdown) and drops the cached clients and chains using it."""
+    if _shared_async_client.cache_info().currsize:
+        await _shared_async_client().aclose()
+
+    for factory in (
+            _shared_async_client, _small_llm, _grader_llm, _big_llm,
+            get_router_chain, get_multi_query_chain, get_document_grader_batch_chain,
+            get_generate_chain, get_hallucination_chain, get_summarize_chain,
+    ):
+        factory.cache_clear()
+
+
+# Use a cheaper model for multi-query to save costs.
+@cache
+def _small_llm() -> ChatGroq:
+    return ChatGroq(
+        model="openai/gpt-oss-20b",
+        temperature=0,
+        api_key=settings.GROQ_API_KEY,
+        http_async_client=_shared_async_client(),
+    )
+
+
+# Use the fastest model for the routing / yes-no grading chains (lowest TTFT).
+# The structured-output chains return a short tool call, so bounding max_tokens prevents runaway decoding.
+# (The tool-call JSON itself takes ~20-30 tokens, plus a few per document for the batch grader.)
+@cache
+def _grader_llm(max_tokens: Optional[int] = None) -> ChatGroq:
+    return ChatGroq(
+        model="llama-3.1-8b-instant",
+        temperature=0,
+        max_tokens=max_tokens,
+        api_key=settings.GROQ_API_KEY,
+        http_async_client=_shared_async_client(),
+    )
+
+
 # Use a stronger model for the actual answer generation.
-small_llm = ChatGroq(
-    model="openai/gpt-oss-20b",
-    temperature=0,
-    api_key=settings.GROQ_API_KEY,
-)
-big_llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0,
-    api_key=settings.GROQ_API_KEY
-)
+@cache
+def _big_llm() -> ChatGroq:
+    return ChatGroq(
+        model="llama-3.3-70b-versatile",
+        temperature=0,
+        api_key=settings.GROQ_API_KEY,
+        http_async_client=_shared_async_client(),
+    )
 
 # --- 1. ROUTER CHAIN ---
 class RouteQuery(BaseModel):
@@ -51,7 +99,9 @@ router_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # Create the router chain with structured output
-router_chain = router_prompt | small_llm.with_structured_output(RouteQuery)
+@cache
+def get_router_chain():
+    return router_prompt | _grader_llm(max_tokens=64).with_structured_output(RouteQuery)
 
 
 # --- 2. MULTI-QUERY CHAIN (Query Translation) ---
@@ -78,31 +128,37 @@ multi_query_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # Create the multi-query chain with structured output
-multi_query_chain = multi_query_prompt | small_llm.with_structured_output(MultiQuery)
+@cache
+def get_multi_query_chain():
+    return multi_query_prompt | _small_llm().with_structured_output(MultiQuery)
 
 
 # --- 3. DOCUMENT GRADER CHAIN (Are documents related?) ---
-class GradeDocuments(BaseModel):
-    """Binary score for relevance check on retrieved documents."""
-    binary_score: Literal["yes", "no"] = Field(
+class GradeDocumentsBatch(BaseModel):
+    """Binary scores for relevance check on a batch of retrieved documents."""
+    scores: List[Literal["yes", "no"]] = Field(
         ...,
-        description="Documents are relevant to the question, 'yes' or 'no'"
+        description="One score per document, in the same order as the documents: 'yes' if relevant, 'no' otherwise"
     )
 
 document_grader_system = """
-You are an expert grader. Your task is to determine if a document chunk is USEFUL for answering the question.
+You are an expert grader. Your task is to determine, for each numbered document chunk, if it is USEFUL for answering the question.
 - If the document contains any information, facts, or context that could contribute to the answer, grade it as 'yes'.
 - Do not be overly strict. If there is semantic overlap, it's a 'yes'.
 - Only grade 'no' if the document is completely irrelevant to the topic.
+
+Return exactly one score per document, in the same order as the documents are numbered.
 """
 
 document_grader_prompt = ChatPromptTemplate.from_messages([
     ("system", document_grader_system),
-    ("human", "Retrieved document: \n\n {document} \n\n User question: {question}"),
+    ("human", "Retrieved documents: \n\n {documents} \n\n User question: {question}"),
 ])
 
-# Create the retrieval grading chain with structured output
-document_grader_chain = document_grader_prompt | small_llm.with_structured_output(GradeDocuments)
+# Create the batch retrieval grading chain with structured output (one LLM call for all documents)
+@cache
+def get_document_grader_batch_chain():
+    return document_grader_prompt | _grader_llm(max_tokens=256).with_structured_output(GradeDocumentsBatch)
 
 
 # --- 4. GENERATION CHAIN ---
@@ -126,7 +182,9 @@ rag_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # Create the generation chain
-generate_chain = rag_prompt | big_llm | StrOutputParser()
+@cache
+def get_generate_chain():
+    return rag_prompt | _big_llm() | StrOutputParser()
 
 
 # --- 5. HALLUCINATION GRADER CHAIN ---
@@ -152,4 +210,25 @@ hallucination_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # Create the hallucination grading chain with structured output
-hallucination_chain = hallucination_prompt | small_llm.with_structured_output(GradeHallucinations)
\ No newline at end of file
+@cache
+def get_hallucination_chain():
+    return hallucination_prompt | _grader_llm(max_tokens=64).with_structured_output(GradeHallucinations)
+
+
+# --- 6. SUMMARIZATION CHAIN (Bounded chat history) ---
+summarize_system = """
+You compress a conversation between a user and an AI assistant.
+Write a concise summary that keeps the facts, names, decisions and open questions needed to continue the conversation.
+If the conversation starts with an earlier summary, merge it into the new one.
+"""
+
+summarize_prompt = ChatPromptTemplate.from_messages([
+    ("system", summarize_system),
+    MessagesPlaceholder(variable_name="messages"),
+    ("human", "Summarize the conversation above."),
+])
+
+# Create the summarization chain
+@cache
+def get_summarize_chain():
+    return summarize_prompt | _small_llm() | StrOutputParser()
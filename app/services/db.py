@@ -1,8 +1,13 @@
+import asyncio
+import hashlib
+from typing import List
+
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from app.core.config import settings
+from app.services.hnsw_store import HNSWVectorStore
 
 
 # Initialize Embedding Model
@@ -11,44 +16,106 @@ embedding_function = GoogleGenerativeAIEmbeddings(
     api_key=settings.GOOGLE_API_KEY,
 )
 
-# Initialize Vector Store (will clear after reload)
-vector_store = Chroma(
-    collection_name="user_documents",
+# Initialize Vector Store (HNSW index + SQLite mapping, saved to VECTOR_STORE_DIR if set)
+# text-embedding-004 vectors are 768-d; small sessions are searched over their int8 copies.
+vector_store = HNSWVectorStore(
     embedding_function=embedding_function,
+    dim=768,
+    space="cosine",
+    persist_dir=settings.VECTOR_STORE_DIR or None,
 )
 
-def ingest_file(file_path: str, session_id: str):
+# Max texts per embeddings request (Google batch limit)
+EMBED_BATCH_SIZE = 100
+
+def file_hash(file_path: str) -> str:
+    """SHA256 of the file bytes, used to detect identical uploads."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+async def ingest_file(file_path: str, session_id: str):
     """
-    Loads a PDF, splits it into chunks, and saves it to ChromaDB
+    Loads a PDF, splits it into chunks, and saves it to the vector store
     with the specific session_id in the metadata.
+    If an identical file was already ingested, its chunks and embeddings are
+    reused for the new session instead of parsing and embedding it again.
+    Hashing, parsing and vector store calls run in worker threads, off the event loop.
     """
-    # 1. Load PDF
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
-
-    # 2. Split text
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
-    )
-    splits = text_splitter.split_documents(docs)
-
-    # 3. Tag with session_id
+    doc_hash = await asyncio.to_thread(file_hash, file_path)
+
+    # 0. Reuse existing chunks of an identical upload
+    if await asyncio.to_thread(vector_store.exists, where={"doc_hash": doc_hash, "session_id": session_id}):
+        print(f"--- INGESTION: File already indexed for session {session_id} ---")
+        return
+
+    source, _ = await asyncio.to_thread(vector_store.get, where={"doc_hash": doc_hash}, limit=1)
+    if source:
+        # Copy the chunks of a single source session
+        source_session = source[0].metadata.get("session_id")
+        cached_docs, cached_embeddings = await asyncio.to_thread(
+            vector_store.get,
+            where={"doc_hash": doc_hash, "session_id": source_session}
+        )
+
+        texts = [doc.page_content for doc in cached_docs]
+        metadatas = [{**doc.metadata, "session_id": session_id} for doc in cached_docs]
+        await asyncio.to_thread(vector_store.add_embeddings, texts, cached_embeddings, metadatas)
+        await asyncio.to_thread(vector_store.save)
+        print(f"--- INGESTION: Reused {len(texts)} cached chunks for session {session_id} ---")
+        return
+
+    # 1. Load PDF and 2. Split text (CPU-bound, off the event loop)
+    def load_and_split():
+        loader = PyPDFLoader(file_path)
+        docs = loader.load()
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200
+        )
+        return text_splitter.split_documents(docs)
+
+    splits = await asyncio.to_thread(load_and_split)
+
+    # 3. Tag with session_id and content hash
     for split in splits:
         split.metadata["session_id"] = session_id
+        split.metadata["doc_hash"] = doc_hash
+
+    # 4. Embed all batches concurrently
+    texts = [split.page_content for split in splits]
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    batch_vectors = await asyncio.gather(*(embedding_function.aembed_documents(batch) for batch in batches))
+    embeddings = [vector for vectors in batch_vectors for vector in vectors]
 
-    # 4. Save to DB
-    vector_store.add_documents(splits)
+    # 5. Save to DB with the pre-computed embeddings
+    await asyncio.to_thread(vector_store.add_embeddings, texts, embeddings, [split.metadata for split in splits])
+    await asyncio.to_thread(vector_store.save)
     print(f"--- INGESTION: Saved {len(splits)} chunks for session {session_id} ---")
 
-def get_retriever(session_id: str):
+async def has_documents(session_id: str) -> bool:
+    """Whether any document was indexed for the session."""
+    return await asyncio.to_thread(vector_store.session_count, session_id) > 0
+
+async def retrieve_for_queries(queries: List[str], session_id: str, k: int = 5) -> List[List[Document]]:
     """
-    Returns a retriever that strictly filters documents by session_id.
+    Embeds all queries in a single batch request, then runs one local
+    similarity search per query vector, filtered by session_id (in a worker
+    thread, since the store lock can be held by a running ingestion).
     """
-    return vector_store.as_retriever(
-        search_type="similarity",
-        search_kwargs={
-            "k": 5,
-            "filter": {"session_id": session_id}
-        }
-    )
\ No newline at end of file
+    vectors = await embedding_function.aembed_documents(queries, task_type="RETRIEVAL_QUERY")
+
+    def search_all():
+        return [
+            vector_store.similarity_search_by_vector(
+                vector,
+                k=k,
+                filter={"session_id": session_id}
+            )
+            for vector in vectors
+        ]
+
+    return await asyncio.to_thread(search_all)
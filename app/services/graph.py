@@ -1,7 +1,9 @@
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from app.services.state import AgentState
 from app.services.nodes import (
+    summarize_node,
     router_node,
     retrieve_node,
     grade_documents_node,
@@ -14,6 +16,7 @@ from app.services.nodes import (
 workflow = StateGraph(AgentState)
 
 # 2. Add Nodes
+workflow.add_node("summarize", summarize_node)
 workflow.add_node("router", router_node)
 workflow.add_node("retrieve", retrieve_node)
 workflow.add_node("grade_documents", grade_documents_node)
@@ -21,8 +24,9 @@ workflow.add_node("web_search", web_search_node)
 workflow.add_node("generate", generate_node)
 workflow.add_node("hallucination_check", hallucination_check_node)
 
-# 3. Entry Point
-workflow.set_entry_point("router")
+# 3. Entry Point (bound the history first, then route)
+workflow.set_entry_point("summarize")
+workflow.add_edge("summarize", "router")
 
 
 # 4. Router Decision
@@ -70,18 +74,37 @@ workflow.add_conditional_edges(
 
 # 7. Standard Edges
 workflow.add_edge("web_search", "generate")
-workflow.add_edge("generate", "hallucination_check")
 
 
-# 8. Hallucination Decision (With Loop Break)
+# 8. Generation Decision (pure-LLM answers have no facts to check against,
+# cached answers were checked when they were stored, and streamed answers cannot be retried)
+def decide_to_check(state, config: RunnableConfig):
+    if state.route == "generate":
+        return "end"
+    elif state.cache_hit:
+        return "end"
+    elif config["configurable"].get("skip_hallucination_check"):
+        return "end"
+    else:
+        return "hallucination_check"
+
+
+workflow.add_conditional_edges(
+    "generate",
+    decide_to_check,
+    {
+        "end": END,
+        "hallucination_check": "hallucination_check"
+    }
+)
+
+
+# 9. Hallucination Decision (With Loop Break)
 def hallucination_decision(state):
     # If we exceeded retry limit (3), assume useful to stop loop
     if state.loop_step > 3:
         return "useful"
 
-    if state.route == "generate":
-        return "useful"
-
     if state.hallucination_grade == "yes":
         return "useful"
     else:
@@ -98,8 +121,12 @@ workflow.add_conditional_edges(
     }
 )
 
-# Initialize memory
-memory = MemorySaver()
 
 # Compile graph
-app_graph = workflow.compile(checkpointer=memory)
\ No newline at end of file
+def compile_graph(checkpointer: BaseCheckpointSaver):
+    """
+    Compiles the workflow with the given checkpointer (memory).
+    Called from the FastAPI lifespan, since the SQLite checkpointer
+    has to be opened inside the running event loop.
+    """
+    return workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,337 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import hnswlib
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Metadata keys stored in their own indexed SQLite columns
+INDEXED_COLUMNS = ("session_id", "doc_hash")
+
+
+class HNSWVectorStore(VectorStore):
+    """
+    Vector store backed by an hnswlib HNSW index.
+    Vectors live in the index under integer labels, while the chunk text and
+    metadata are kept in a SQLite table keyed by the same label (session_id and
+    doc_hash are also stored in indexed columns).
+    A session_id filter is resolved in SQLite first: small sessions are searched
+    exactly over their own vectors, large ones with an oversampled k-NN query
+    filtered in Python.
+    hnswlib only holds float32 vectors, so an int8 copy of each vector (with a
+    per-vector scale) is kept in SQLite and scored by the exact search.
+    If persist_dir is set, the index and the SQLite table are saved there and
+    reloaded on startup (the index only when save() is called, rows added after
+    the last save are dropped on reload); otherwise both stay in memory.
+    """
+
+    def __init__(
+            self,
+            embedding_function: Embeddings,
+            dim: int = 768,
+            space: str = "cosine",
+            max_elements: int = 10_000,
+            ef_construction: int = 200,
+            M: int = 16,
+            ef: int = 100,
+            oversample: int = 4,
+            exact_search_threshold: int = 1_000,
+            persist_dir: Optional[str] = None,
+    ):
+        self._embedding_function = embedding_function
+        self.space = space
+        self.oversample = oversample
+        self.exact_search_threshold = exact_search_threshold
+
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self.index_path = os.path.join(persist_dir, "index.bin")
+            db_path = os.path.join(persist_dir, "chunks.sqlite")
+        else:
+            self.index_path = None
+            db_path = ":memory:"
+
+        # 1. Label -> (page_content, session_id, metadata, int8 vector) mapping
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY, page_content TEXT, session_id TEXT, doc_hash TEXT, metadata TEXT, "
+                "qvec BLOB, qscale REAL)"
+            )
+            # Tables saved before the int8 columns existed
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")}
+            if "qvec" not in columns:
+                self.conn.execute("ALTER TABLE chunks ADD COLUMN qvec BLOB")
+                self.conn.execute("ALTER TABLE chunks ADD COLUMN qscale REAL")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_session ON chunks (session_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_hash ON chunks (doc_hash, session_id)")
+
+        # 2. ANN index (reloaded from disk if it was saved before)
+        self.index = hnswlib.Index(space=space, dim=dim)
+        if self.index_path and os.path.exists(self.index_path):
+            self.index.load_index(self.index_path, max_elements=max_elements)
+        else:
+            self.index.init_index(max_elements=max_elements, ef_construction=ef_construction, M=M)
+        self.index.set_ef(ef)
+
+        # Drop rows whose vectors did not make it into the saved index
+        with self.conn:
+            self.conn.execute("DELETE FROM chunks WHERE id >= ?", (self.index.get_current_count(),))
+
+            # Quantize rows saved without an int8 vector
+            missing = [row_id for (row_id,) in self.conn.execute("SELECT id FROM chunks WHERE qvec IS NULL")]
+            if missing:
+                codes, scales = self._quantize(np.asarray(self.index.get_items(missing), dtype=np.float32))
+                self.conn.executemany(
+                    "UPDATE chunks SET qvec = ?, qscale = ? WHERE id = ?",
+                    [(code.tobytes(), float(scale), row_id) for row_id, code, scale in zip(missing, codes, scales)]
+                )
+
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Symmetric per-vector int8 quantization: vector ~= codes * scale."""
+        if self.space == "cosine":
+            # Same normalization hnswlib applies to the vectors it stores
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def add_embeddings(
+            self,
+            texts: List[str],
+            embeddings: List[List[float]],
+            metadatas: Optional[List[dict]] = None,
+    ) -> List[str]:
+        """Adds pre-computed embeddings without calling the embedding model."""
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+
+        with self._lock:
+            start = self.index.get_current_count()
+            labels = np.arange(start, start + len(texts))
+
+            # Grow the index if needed
+            needed = start + len(texts)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            codes, scales = self._quantize(vectors)
+
+            self.index.add_items(vectors, labels)
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO chunks (id, page_content, session_id, doc_hash, metadata, qvec, qscale) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            int(label), text, metadata.get("session_id"), metadata.get("doc_hash"),
+                            json.dumps(metadata), code.tobytes(), float(scale)
+                        )
+                        for label, text, metadata, code, scale in zip(labels, texts, metadatas, codes, scales)
+                    ]
+                )
+
+        return [str(label) for label in labels]
+
+    def save(self):
+        """Writes the index to persist_dir (no-op for in-memory stores)."""
+        if not self.index_path:
+            return
+        with self._lock:
+            # Write a new file and swap it in, so a crash never leaves a truncated index
+            self.index.save_index(self.index_path + ".tmp")
+            os.replace(self.index_path + ".tmp", self.index_path)
+
+    def add_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[List[dict]] = None,
+            **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas)
+
+    def session_count(self, session_id: str) -> int:
+        """Number of chunks stored for the session."""
+        with self._lock:
+            (count,) = self.conn.execute(
+                "SELECT COUNT(*) FROM chunks WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return count
+
+    def _fetch(self, labels: List[int]) -> dict:
+        placeholders = ",".join("?" * len(labels))
+        rows = self.conn.execute(
+            f"SELECT id, page_content, metadata FROM chunks WHERE id IN ({placeholders})",
+            labels
+        ).fetchall()
+        return {
+            row_id: Document(page_content=content, metadata=json.loads(metadata))
+            for row_id, content, metadata in rows
+        }
+
+    @staticmethod
+    def _where_sql(where: dict) -> Tuple[str, list]:
+        """WHERE clause for metadata equality filters, using the indexed columns when possible."""
+        if not where:
+            return "", []
+        clauses, params = [], []
+        for key, value in where.items():
+            if key in INDEXED_COLUMNS:
+                clauses.append(f"{key} = ?")
+                params.append(value)
+            else:
+                clauses.append("json_extract(metadata, ?) = ?")
+                params.extend([f"$.{key}", value])
+        return " WHERE " + " AND ".join(clauses), params
+
+    def exists(self, where: dict) -> bool:
+        """Whether any document matches all `where` values."""
+        clause, params = self._where_sql(where)
+        with self._lock:
+            row = self.conn.execute(f"SELECT 1 FROM chunks{clause} LIMIT 1", params).fetchone()
+        return row is not None
+
+    def get(self, where: dict, limit: Optional[int] = None) -> Tuple[List[Document], List[List[float]]]:
+        """Returns the documents whose metadata matches all `where` values, with their stored embeddings."""
+        clause, params = self._where_sql(where)
+        query = f"SELECT id, page_content, metadata FROM chunks{clause} ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            if not rows:
+                return [], []
+            embeddings = self.index.get_items([row_id for row_id, _, _ in rows])
+
+        documents = [
+            Document(page_content=content, metadata=json.loads(metadata))
+            for _, content, metadata in rows
+        ]
+        return documents, [list(embedding) for embedding in embeddings]
+
+    def _distances(self, codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Distances hnswlib uses for the configured space, computed on the int8 vectors."""
+        if self.space == "l2":
+            return np.sum((codes * scales[:, None] - query) ** 2, axis=1)
+        if self.space == "cosine":
+            # Stored vectors were normalized before quantization
+            query = query / np.linalg.norm(query)
+        return 1.0 - (codes.astype(np.float32) @ query) * scales
+
+    def _exact_search(self, query: np.ndarray, session_id: str, k: int, filter: dict) -> List[Document]:
+        """Brute-force search over the int8 vectors of a single (small) session."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, qvec, qscale FROM chunks WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        labels = [row_id for row_id, _, _ in rows]
+        codes = np.frombuffer(b"".join(qvec for _, qvec, _ in rows), dtype=np.int8).reshape(len(rows), -1)
+        scales = np.array([qscale for _, _, qscale in rows], dtype=np.float32)
+        ranked = [labels[i] for i in np.argsort(self._distances(codes, scales, query), kind="stable")]
+
+        # Only load the text / metadata of the best candidates
+        results = []
+        batch_size = k * self.oversample
+        for start in range(0, len(ranked), batch_size):
+            batch = ranked[start:start + batch_size]
+            with self._lock:
+                docs_by_id = self._fetch(batch)
+            for label in batch:
+                doc = docs_by_id[label]
+                if any(doc.metadata.get(key) != value for key, value in filter.items()):
+                    continue
+                results.append(doc)
+                if len(results) == k:
+                    return results
+        return results
+
+    def similarity_search_by_vector(
+            self,
+            embedding: List[float],
+            k: int = 4,
+            filter: Optional[dict] = None,
+            **kwargs: Any,
+    ) -> List[Document]:
+        filter = filter or {}
+        query = np.asarray(embedding, dtype=np.float32)
+
+        count = self.index.get_current_count()
+        if count == 0:
+            return []
+
+        # Resolve the session in SQLite first: empty sessions need no search,
+        # small ones are cheaper to scan exactly than to widen the k-NN query
+        target = k
+        session_id = filter.get("session_id")
+        if session_id is not None:
+            session_size = self.session_count(session_id)
+            if session_size == 0:
+                return []
+            if session_size <= self.exact_search_threshold:
+                return self._exact_search(query, session_id, k, filter)
+            target = min(k, session_size)
+
+        # Oversample to leave room for the metadata filter, widen until we have enough hits
+        n_candidates = min(k * self.oversample, count)
+        while True:
+            with self._lock:
+                labels, _ = self.index.knn_query(query, k=n_candidates)
+                labels = [int(label) for label in labels[0]]
+                docs_by_id = self._fetch(labels)
+
+            results = []
+            for label in labels:
+                doc = docs_by_id.get(label)
+                if doc is None:
+                    continue
+                if any(doc.metadata.get(key) != value for key, value in filter.items()):
+                    continue
+                results.append(doc)
+                if len(results) == target:
+                    return results
+
+            if n_candidates >= count:
+                return results
+            n_candidates = min(n_candidates * 2, count)
+
+    def similarity_search(
+            self,
+            query: str,
+            k: int = 4,
+            filter: Optional[dict] = None,
+            **kwargs: Any,
+    ) -> List[Document]:
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter, **kwargs)
+
+    @classmethod
+    def from_texts(
+            cls,
+            texts: List[str],
+            embedding: Embeddings,
+            metadatas: Optional[List[dict]] = None,
+            **kwargs: Any,
+    ) -> "HNSWVectorStore":
+        store = cls(embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas)
+        return store
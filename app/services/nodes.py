@@ -1,55 +1,132 @@
-from langchain_core.messages import AIMessage
+import asyncio
+import re
+
+from langchain_core.messages import AIMessage, RemoveMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_tavily import TavilySearch
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 from app.core.config import settings
 from app.services.chains import (
-    router_chain,
-    multi_query_chain,
-    generate_chain,
-    hallucination_chain, document_grader_chain
+    get_router_chain,
+    get_multi_query_chain,
+    get_generate_chain,
+    get_summarize_chain,
+    get_hallucination_chain,
+    get_document_grader_batch_chain
 )
-from app.services.db import get_retriever
+from app.services.db import has_documents, retrieve_for_queries
+from app.services.semantic_cache import semantic_cache
 from app.services.state import AgentState
 from app.utils.rag_fusion import reciprocal_rank_fusion
 
 # Initialize Tavily
 web_search_tool = TavilySearch(k=3, tavily_api_key=settings.TAVILY_API_KEY)
 
+# Chat history is summarized once it grows past MAX_MESSAGES, keeping the last KEEP_LAST_MESSAGES as is
+MAX_MESSAGES = 20
+KEEP_LAST_MESSAGES = 6
+
+# Trivial inputs routed without calling the router LLM (compiled once).
+# Greetings must be the whole message; web patterns only cover unambiguous phrasing
+# and are skipped when the session has uploaded documents.
+_QUICK_GREETINGS = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|bye)[\s!.,]*$", re.I)
+_QUICK_WEB = re.compile(r"\b(weather (today|tomorrow|forecast)|(latest|breaking|today'?s) news|stock price of)\b", re.I)
+
+
+def _quick_route(question: str, has_documents: bool):
+    """Returns the route for obvious greetings / web queries, or None if ambiguous."""
+    if _QUICK_GREETINGS.match(question):
+        return "generate"
+    if not has_documents and _QUICK_WEB.search(question):
+        return "web_search"
+    return None
+
 # --- NODES ---
 
-def router_node(state: AgentState):
-    """Decides the initial path."""
+async def summarize_node(state: AgentState):
+    """Compresses older turns into a single summary message to keep the prompt size bounded."""
+    messages = state.messages
+    if len(messages) <= MAX_MESSAGES:
+        return {}
+
+    print("--- NODE: Summarize History ---")
+    older, recent = messages[:-KEEP_LAST_MESSAGES], messages[-KEEP_LAST_MESSAGES:]
+    summary = await get_summarize_chain().ainvoke({"messages": older})
+
+    # Replace the whole history with [summary, *recent]
+    return {
+        "messages": [
+            RemoveMessage(id=REMOVE_ALL_MESSAGES),
+            SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"),
+            *recent
+        ]
+    }
+
+
+async def router_node(state: AgentState):
+    """
+    Decides the initial path.
+    The multi-query expansion is generated speculatively in parallel with routing,
+    so it is already available if the router picks the vectorstore.
+    """
     print("--- NODE: Router ---")
 
-    source = router_chain.invoke({
-        "question": state.question,
-        "messages": state.messages
-    })
+    # Short-circuit trivial cases without any LLM call
+    route = _quick_route(state.question, await has_documents(state.session_id))
+    if route:
+        print(f"--- ROUTER: quick route to {route} ---")
+        return {
+            "route": route,
+            "loop_step": 0,
+            "documents": [],
+            "hallucination_grade": "",
+            "cache_hit": False,
+            "multi_queries": []
+        }
+
+    source, multi_queries = await asyncio.gather(
+        get_router_chain().ainvoke({
+            "question": state.question,
+            "messages": state.messages
+        }),
+        get_multi_query_chain().ainvoke({"question": state.question}),
+        return_exceptions=True
+    )
+
+    # Routing is required, the speculative multi-query result is optional
+    if isinstance(source, Exception):
+        raise source
+    if isinstance(multi_queries, Exception):
+        print(f"Error generating multi-queries: {multi_queries}")
+        multi_queries = None
 
     return {
         "route": source.datasource,
         "loop_step": 0,
-        "documents": []
+        "documents": [],
+        "hallucination_grade": "",
+        "cache_hit": False,
+        "multi_queries": multi_queries.questions if multi_queries else []
     }
 
 
-def retrieve_node(state: AgentState):
+async def retrieve_node(state: AgentState):
     """Generates multiple queries, retrieves documents for each, and fuses results."""
     print("--- NODE: Retrieval (Multi-Query + Fusion) ---")
     question = state.question
     session_id = state.session_id
-    retriever = get_retriever(session_id)
 
-    # 1. Generate alternative questions
-    multi_queries = multi_query_chain.invoke({"question": question})
+    # 1. Reuse alternative questions prepared by the router, or generate them now
+    alternative_questions = state.multi_queries
+    if not alternative_questions:
+        multi_queries = await get_multi_query_chain().ainvoke({"question": question})
+        alternative_questions = multi_queries.questions
     # Use original question + 3 generated ones
-    queries = [question] + multi_queries.questions
+    queries = [question] + alternative_questions
     print(f"--- Generated {len(queries)} queries ---")
 
-    # 2. Retrieve documents for each query
-    final_results = []
-    for q in queries:
-        docs = retriever.invoke(q)
-        final_results.append(docs)
+    # 2. Retrieve documents for all queries (one batched embedding call + local searches)
+    final_results = await retrieve_for_queries(queries, session_id)
 
     # 3. Apply RAG Fusion
     unique_docs = reciprocal_rank_fusion(final_results)
@@ -57,25 +134,32 @@ def retrieve_node(state: AgentState):
     return {"documents": [doc.page_content for doc in unique_docs]}
 
 
-def grade_documents_node(state: AgentState):
+async def grade_documents_node(state: AgentState):
     """Filters retrieved documents for relevance."""
     print("--- NODE: Grade Documents ---")
     question = state.question
     documents = state.documents
 
-    filtered_docs = []
-    for doc in documents:
-        score = document_grader_chain.invoke({"question": question, "document": doc})
-        if score.binary_score == "yes":
-            filtered_docs.append(doc)
-        else:
-            continue
+    if not documents:
+        return {"documents": []}
+
+    # Grade all documents in a single LLM call
+    numbered_docs = "\n\n".join(f"[{i}] {doc}" for i, doc in enumerate(documents))
+    result = await get_document_grader_batch_chain().ainvoke({"question": question, "documents": numbered_docs})
+
+    scores = list(result.scores)
+    if len(scores) != len(documents):
+        # The grader returned the wrong number of scores: keep the ungraded documents
+        print(f"--- GRADE: got {len(scores)} scores for {len(documents)} documents ---")
+        scores = (scores + ["yes"] * len(documents))[:len(documents)]
+
+    filtered_docs = [doc for doc, score in zip(documents, scores) if score == "yes"]
 
     print(f"--- GRADE: kept {len(filtered_docs)} relevant documents ---")
     return {"documents": filtered_docs}
 
 
-def web_search_node(state: AgentState):
+async def web_search_node(state: AgentState):
     """
     Minimalist web search node.
     Safely extracts content and ignores everything else.
@@ -87,7 +171,7 @@ def web_search_node(state: AgentState):
 
     try:
         # 1. Invoke tool
-        response = web_search_tool.invoke({"query": question})
+        response = await web_search_tool.ainvoke({"query": question})
 
         content_list = []
 
@@ -113,7 +197,7 @@ def web_search_node(state: AgentState):
         return {"documents": ["Web search failed."], "loop_step": new_step}
 
 
-def generate_node(state: AgentState):
+async def generate_node(state: AgentState, config: RunnableConfig):
     """Generates the final answer."""
     print("--- NODE: Generate ---")
     question = state.question
@@ -121,40 +205,70 @@ def generate_node(state: AgentState):
     messages = state.messages
 
     if not documents:
+        # Answers without context depend on the conversation history, so they are not cached
         context = "No external context provided."
+        key_vec = None
     else:
         context = "\n\n".join(documents)
+        key_vec = await semantic_cache.aembed_key(question)
+
+        # Short-circuit on a similar question answered over the same context in this session
+        cached = semantic_cache.lookup(key_vec, context, state.session_id)
+        if cached is not None:
+            print("--- GENERATE: semantic cache hit ---")
+            # Cached answers were already graded as grounded in this context
+            return {
+                "generation": cached,
+                "messages": [AIMessage(content=cached)],
+                "hallucination_grade": "yes",
+                "cache_hit": True
+            }
 
     # Invoke the chain (which includes message history in the prompt)
-    generation = generate_chain.invoke({
+    generation = await get_generate_chain().ainvoke({
         "context": context,
         "question": question,
         "messages": messages
     })
 
+    # The answer is cached by the hallucination check once it is graded as grounded
+    # (never on the streaming path, where the check is skipped)
+    if key_vec is not None and not config["configurable"].get("skip_hallucination_check"):
+        semantic_cache.stage(state.session_id, question, key_vec)
+
     return {
         "generation": generation,
-        "messages": [AIMessage(content=generation)]
+        "messages": [AIMessage(content=generation)],
+        "cache_hit": False
     }
 
 
-def hallucination_check_node(state: AgentState):
+async def hallucination_check_node(state: AgentState):
     """Checks for hallucinations. Includes loop breaker."""
     print("--- NODE: Hallucination Check ---")
     documents = state.documents
     generation = state.generation
 
-    # 1. Loop Protection: If we retried too many times, force success
+    # 1. Loop Protection: If we retried too many times, force success (without caching)
     if state.loop_step > 3:
         print(f"--- LOOP DETECTED (Step {state.loop_step}): Force finishing ---")
+        semantic_cache.discard(state.session_id, state.question)
         return {"hallucination_grade": "yes"}
 
     # 2. If no docs, skip check
     if not documents:
+        semantic_cache.discard(state.session_id, state.question)
         return {"hallucination_grade": "yes"}
 
-    score = hallucination_chain.invoke({"documents": documents, "generation": generation})
+    score = await get_hallucination_chain().ainvoke({"documents": documents, "generation": generation})
     grade = score.binary_score
 
     print(f"--- HALLUCINATION CHECK: {grade} (Step {state.loop_step}) ---")
+
+    # Only grounded answers are cached
+    if grade == "yes":
+        semantic_cache.commit(state.session_id, state.question, "\n\n".join(documents), generation, ttl=3600)
+    else:
+        semantic_cache.discard(state.session_id, state.question)
+
     return {"hallucination_grade": grade}
\ No newline at end of file
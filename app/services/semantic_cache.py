@@ -0,0 +1,108 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import chromadb
+
+from app.services.db import embedding_function
+
+
+class SemanticCache:
+    """
+    Semantic cache for LLM generations stored in a separate Chroma collection.
+    Entries are keyed by the embedded question, the hash of the context and the
+    session_id, so near-duplicate questions over the same context in the same
+    session reuse the cached answer (answers also depend on the chat history).
+    Fresh generations are staged in process, keyed by (session_id, question),
+    until the hallucination check decides whether they are stored.
+    """
+
+    def __init__(
+            self,
+            collection_name: str = "llm_cache",
+            threshold: float = 0.95,
+            ttl: int = 3600,
+            max_pending: int = 1024,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_pending = max_pending
+
+        # (session_id, question) -> question embedding of a generation awaiting its check
+        self._pending: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+
+        # Cosine space, so similarity = 1 - distance (will clear after reload)
+        self.collection = chromadb.Client().get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    @staticmethod
+    def context_hash(context: str) -> str:
+        return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+    async def aembed_key(self, question: str) -> List[float]:
+        """Embeds the question using the same model as the vector store."""
+        return await embedding_function.aembed_query(question)
+
+    def lookup(self, key_vec: List[float], context: str, session_id: str) -> Optional[str]:
+        """Returns the cached generation for a similar question over the same context in the session, if any."""
+        result = self.collection.query(
+            query_embeddings=[key_vec],
+            n_results=1,
+            where={
+                "$and": [
+                    {"context_hash": self.context_hash(context)},
+                    {"session_id": session_id},
+                    {"expires_at": {"$gt": time.time()}}
+                ]
+            }
+        )
+
+        if not result["ids"] or not result["ids"][0]:
+            return None
+
+        similarity = 1 - result["distances"][0][0]
+        if similarity < self.threshold:
+            return None
+
+        return result["documents"][0][0]
+
+    def put(self, key_vec: List[float], context: str, generation: str, session_id: str, ttl: Optional[int] = None):
+        """Stores a generation and drops expired entries."""
+        now = time.time()
+        self.collection.delete(where={"expires_at": {"$lte": now}})
+
+        self.collection.add(
+            ids=[str(uuid.uuid4())],
+            embeddings=[key_vec],
+            documents=[generation],
+            metadatas=[{
+                "context_hash": self.context_hash(context),
+                "session_id": session_id,
+                "expires_at": now + (ttl if ttl is not None else self.ttl)
+            }]
+        )
+
+    def stage(self, session_id: str, question: str, key_vec: List[float]):
+        """Keeps the key of a fresh generation until its hallucination check (oldest dropped past max_pending)."""
+        self._pending[(session_id, question)] = key_vec
+        self._pending.move_to_end((session_id, question))
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def commit(self, session_id: str, question: str, context: str, generation: str, ttl: Optional[int] = None):
+        """Stores the staged generation once it was graded as grounded."""
+        key_vec = self._pending.pop((session_id, question), None)
+        if key_vec is not None:
+            self.put(key_vec, context, generation, session_id, ttl=ttl)
+
+    def discard(self, session_id: str, question: str):
+        """Drops the staged key of a generation that will not be cached."""
+        self._pending.pop((session_id, question), None)
+
+
+# Initialize Semantic Cache
+semantic_cache = SemanticCache()
@@ -16,6 +16,8 @@ class AgentState(BaseModel):
         route: The decision made by the router (web_search/vectorstore).
         hallucination_grade: Result of the hallucination check (yes/no).
         loop_step: How many times we did loop.
+        multi_queries: Alternative questions generated alongside routing (reused by retrieval).
+        cache_hit: Whether the generation came from the semantic cache (already checked, skips the hallucination check).
     """
     messages: Annotated[list, add_messages] = Field(default_factory=list)
     question: str = Field(default="")
@@ -24,4 +26,6 @@ class AgentState(BaseModel):
     session_id: str = Field(default="")
     route: str = Field(default="")
     hallucination_grade: str = Field(default="")
-    loop_step: int = Field(default=0)
\ No newline at end of file
+    loop_step: int = Field(default=0)
+    multi_queries: List[str] = Field(default_factory=list)
+    cache_hit: bool = Field(default=False)
\ No newline at end of file
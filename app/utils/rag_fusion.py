@@ -1,21 +1,57 @@
+import numpy as np
+import xxhash
+from numba import njit
+
+
+@njit(cache=True)
+def _rrf_scores(doc_ids, ranks, k, n_docs):
+    """ Numba kernel: accumulates reciprocal rank scores per document id. """
+    scores = np.zeros(n_docs)
+    for i in range(doc_ids.size):
+        scores[doc_ids[i]] += 1.0 / (ranks[i] + k)
+    return scores
+
+
 # --- HELPER: RAG FUSION ALGORITHM ---
 def reciprocal_rank_fusion(results: list[list], k=60):
     """ Reciprocal Rank Fusion that fuses multiple lists of ranked documents. """
-    fused_scores = {}
-    doc_map = {}
+    doc_to_id = {}
+    id_to_doc = []
+    doc_ids = []
+    ranks = []
 
+    # Intern page_content to contiguous int ids (the numeric loop runs in the kernel).
+    # Documents are keyed by a 64-bit xxh3 digest plus length instead of the full text.
     for docs in results:
         for rank, doc in enumerate(docs):
             doc_str = doc.page_content
-            doc_map[doc_str] = doc
-            if doc_str not in fused_scores:
-                fused_scores[doc_str] = 0
-            fused_scores[doc_str] += 1 / (rank + k)
-
-    # Sort by score descending
-    reranked_results = [
-        (doc_map[doc], score)
-        for doc, score in sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
-    ]
+            key = (xxhash.xxh3_64_intdigest(doc_str.encode("utf-8")), len(doc_str))
+            if key not in doc_to_id:
+                doc_to_id[key] = len(id_to_doc)
+                id_to_doc.append(doc)
+            # Keep the latest occurrence, as before
+            id_to_doc[doc_to_id[key]] = doc
+            doc_ids.append(doc_to_id[key])
+            ranks.append(rank)
+
+    if not id_to_doc:
+        return []
+
+    scores = _rrf_scores(
+        np.array(doc_ids, dtype=np.int32),
+        np.array(ranks, dtype=np.int32),
+        k,
+        len(id_to_doc)
+    )
+
+    # Find the 5th best score in O(N), then stable-sort only the candidates at or above it,
+    # so ties keep first-seen order
+    top_n = 5
+    if scores.size > top_n:
+        kth = np.partition(-scores, top_n - 1)[top_n - 1]
+        candidates = np.flatnonzero(-scores <= kth)
+    else:
+        candidates = np.arange(scores.size)
+    top = candidates[np.argsort(-scores[candidates], kind="stable")][:top_n]
     # Return top 5 unique documents
-    return [doc for doc, _ in reranked_results[:5]]
+    return [id_to_doc[i] for i in top]
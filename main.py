@@ -1,18 +1,39 @@
 import os
 import shutil
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from app.api.routes import router
+from app.core.config import settings
+from app.services.chains import aclose_clients
+from app.services.graph import compile_graph
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Opens the chat history checkpointer and compiles the graph; closes both clients on shutdown."""
+    try:
+        async with AsyncSqliteSaver.from_conn_string(settings.CHECKPOINT_DB_PATH) as memory:
+            app.state.graph = compile_graph(memory)
+            yield
+    finally:
+        await aclose_clients()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Adaptive RAG Agent API",
     description="API for RAG with Multi-query, Fusion, and Self-Correction",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson serializes long generations faster than the stdlib json encoder
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS (Critical for frontend communication)
@@ -0,0 +1,143 @@
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.services.hnsw_store import HNSWVectorStore
+
+DIM = 8
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic embeddings: each text maps to a fixed random vector."""
+
+    def _embed(self, text: str):
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        return rng.normal(size=DIM).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def make_store(**kwargs):
+    return HNSWVectorStore(embedding_function=FakeEmbeddings(), dim=DIM, max_elements=16, **kwargs)
+
+
+def add_session(store, session_id, n):
+    texts = [f"{session_id}-{i}" for i in range(n)]
+    store.add_texts(texts, metadatas=[{"session_id": session_id} for _ in texts])
+    return texts
+
+
+@pytest.mark.parametrize("exact_search_threshold", [0, 1_000])
+def test_search_is_filtered_by_session(exact_search_threshold):
+    store = make_store(exact_search_threshold=exact_search_threshold)
+    add_session(store, "a", 30)
+    texts_b = add_session(store, "b", 30)
+
+    query = store.embeddings.embed_query(texts_b[3])
+    docs = store.similarity_search_by_vector(query, k=5, filter={"session_id": "b"})
+
+    assert len(docs) == 5
+    assert docs[0].page_content == texts_b[3]
+    assert all(doc.metadata["session_id"] == "b" for doc in docs)
+
+
+def test_small_and_empty_sessions():
+    store = make_store(exact_search_threshold=0)
+    add_session(store, "big", 40)
+    texts_small = add_session(store, "small", 2)
+
+    query = store.embeddings.embed_query("anything")
+    docs = store.similarity_search_by_vector(query, k=5, filter={"session_id": "small"})
+    assert sorted(doc.page_content for doc in docs) == sorted(texts_small)
+
+    assert store.similarity_search_by_vector(query, k=5, filter={"session_id": "missing"}) == []
+
+
+def test_index_grows_past_max_elements():
+    store = make_store()
+    add_session(store, "a", 50)
+
+    assert store.index.get_current_count() == 50
+    assert store.session_count("a") == 50
+
+
+def test_get_returns_documents_with_embeddings():
+    store = make_store()
+    add_session(store, "a", 3)
+    add_session(store, "b", 2)
+
+    docs, embeddings = store.get(where={"session_id": "b"})
+    assert [doc.page_content for doc in docs] == ["b-0", "b-1"]
+    assert len(embeddings) == 2 and len(embeddings[0]) == DIM
+
+    all_docs, _ = store.get(where={})
+    assert len(all_docs) == 5
+
+
+def test_persisted_store_reloads(tmp_path):
+    store = make_store(persist_dir=str(tmp_path))
+    texts = add_session(store, "a", 20)
+    store.save()
+
+    reloaded = make_store(persist_dir=str(tmp_path))
+    assert reloaded.index.get_current_count() == 20
+
+    query = reloaded.embeddings.embed_query(texts[7])
+    docs = reloaded.similarity_search_by_vector(query, k=1, filter={"session_id": "a"})
+    assert docs[0].page_content == texts[7]
+
+    # New labels continue after the reloaded ones
+    ids = reloaded.add_texts(["new-0", "new-1"], metadatas=[{"session_id": "a"}] * 2)
+    assert ids == ["20", "21"]
+    assert reloaded.session_count("a") == 22
+
+
+def test_get_and_exists_on_indexed_columns():
+    store = make_store()
+    for session_id in ("a", "b"):
+        texts = [f"{session_id}-{i}" for i in range(3)]
+        store.add_texts(texts, metadatas=[{"session_id": session_id, "doc_hash": "h1"} for _ in texts])
+
+    assert store.exists(where={"doc_hash": "h1", "session_id": "b"})
+    assert not store.exists(where={"doc_hash": "h1", "session_id": "c"})
+
+    first, _ = store.get(where={"doc_hash": "h1"}, limit=1)
+    assert [doc.page_content for doc in first] == ["a-0"]
+
+    docs, embeddings = store.get(where={"doc_hash": "h1", "session_id": "b"})
+    assert [doc.page_content for doc in docs] == ["b-0", "b-1", "b-2"]
+    assert len(embeddings) == 3
+
+
+def test_exact_search_backfills_int8_vectors(tmp_path):
+    store = make_store(persist_dir=str(tmp_path))
+    texts = add_session(store, "a", 10)
+    store.save()
+    with store.conn:
+        store.conn.execute("UPDATE chunks SET qvec = NULL, qscale = NULL")
+
+    reloaded = make_store(persist_dir=str(tmp_path))
+    (missing,) = reloaded.conn.execute("SELECT COUNT(*) FROM chunks WHERE qvec IS NULL").fetchone()
+    assert missing == 0
+
+    query = reloaded.embeddings.embed_query(texts[4])
+    docs = reloaded.similarity_search_by_vector(query, k=3, filter={"session_id": "a"})
+    assert docs[0].page_content == texts[4]
+
+
+def test_rows_after_last_save_are_dropped_on_reload(tmp_path):
+    store = make_store(persist_dir=str(tmp_path))
+    add_session(store, "a", 5)
+    store.save()
+    add_session(store, "b", 5)
+
+    reloaded = make_store(persist_dir=str(tmp_path))
+    assert reloaded.index.get_current_count() == 5
+    assert reloaded.session_count("a") == 5
+    assert reloaded.session_count("b") == 0